@@ -1,3 +1,4 @@
 from .solver import * # noqa
 from .random_formula_generator import * # noqa
 from .formula import * # noqa
+from .cube_and_conquer import * # noqa
@@ -0,0 +1,581 @@
+import heapq
+import multiprocessing
+from .formula import Atom, Not, And, Or, If, Formula
+from typing import List, Dict, Tuple, FrozenSet, Optional, Set
+
+"""Cube-and-conquer solving for formulas.
+
+A formula is first put into clause form. A lookahead phase then splits
+the clause form into many cubes (partial assignments), always splitting
+the cube that looks hardest, so that the work handed out is roughly
+balanced. The cubes are placed on a task queue shared by a pool of worker
+processes; each idle worker takes the next cube and runs DPLL on it. The
+whole job stops as soon as one cube is found to be satisfiable.
+
+  Typical usage example:
+
+    formula = And([Or([Atom("p"), Atom("q")]), Not(Atom("p"))])
+    solver = CubeAndConquer(formula)
+    solver.satisfiable()
+"""
+
+Literal = Tuple[Atom, bool]
+Clause = FrozenSet[Literal]
+Assignment = Dict[Atom, bool]
+
+
+###############
+# Clause Form #
+###############
+
+
+class ClauseForm:
+    """The ClauseForm class holds a formula as a conjunction of clauses.
+
+    The translation is the Tseitin encoding: every compound subformula
+    is given a fresh atom that is constrained to be equivalent to it, so
+    the clause form grows linearly with the formula and is satisfiable
+    exactly when the formula is.
+
+    :ivar formula: The formula that the clauses were generated for.
+    :ivar atoms: The atomic formulas of the original formula.
+    :ivar clauses: A list of clauses. Each clause is a frozenset of
+        literals, and each literal is a tuple of an atom and the truth
+        value that satisfies it.
+    :ivar variables: Every atom of the clauses, original atoms first and
+        sorted by root, then the Tseitin atoms. An atom is numbered by
+        its position in this list plus one.
+    :ivar numbers: A dictionary from atoms to their numbers.
+    :ivar literal_clauses: The clauses with each literal written as an
+        atom's number, negated when the atom must be false.
+    :ivar occurrences: A dictionary from each atom's number to the
+        number of clauses it occurs in.
+    """
+
+    def __init__(self, formula: Formula):
+        """The init class for clause forms.
+
+        This sets the formula, gathers its atomic formulas and
+        generates the clauses.
+        """
+        self.formula = formula
+        self.atoms: Set[Atom] = formula.atomic_formulas()
+        self.clauses: List[Clause] = []
+        self.fresh_count = 0
+        self.tseitin_atoms: List[Atom] = []
+        root = self.encode(formula)
+        self.clauses.append(frozenset([root]))
+        self.variables: List[Atom] = sorted(self.atoms,
+                                            key=lambda atom: atom.root)
+        self.variables += self.tseitin_atoms
+        self.numbers: Dict[Atom, int] = {atom: number + 1
+                                         for number, atom
+                                         in enumerate(self.variables)}
+        self.literal_clauses: List[List[int]] = []
+        self.occurrences: Dict[int, int] = {number: 0 for number
+                                            in self.numbers.values()}
+        for clause in self.clauses:
+            literal_clause = [self.literal(literal) for literal in clause]
+            self.literal_clauses.append(literal_clause)
+            for literal_number in literal_clause:
+                self.occurrences[abs(literal_number)] += 1
+
+    def fresh_atom(self) -> Atom:
+        """Returns an atom that does not occur in the original formula.
+
+        :returns: A new atomic formula for naming a subformula.
+        """
+        while True:
+            self.fresh_count += 1
+            atom = Atom(f"_tseitin{self.fresh_count}")
+            if atom not in self.atoms:
+                self.tseitin_atoms.append(atom)
+                return atom
+
+    def literal(self, literal: Literal) -> int:
+        """Numbers a literal.
+
+        :param literal: A tuple of an atom and a truth value.
+
+        :returns: The atom's number, negated if the truth value is False.
+        """
+        atom, polarity = literal
+        number = self.numbers[atom]
+        return number if polarity else -number
+
+    def encode(self, formula: Formula) -> Literal:
+        """Adds the clauses defining a subformula to self.clauses.
+
+        :param formula: The subformula being encoded.
+
+        :returns: A literal that is true exactly when the
+            subformula is true.
+        """
+        if isinstance(formula, Atom):
+            return (formula, True)
+        elif isinstance(formula, Not):
+            atom, polarity = self.encode(formula.negatum)
+            return (atom, not polarity)
+        elif isinstance(formula, And):
+            juncts = [self.encode(conjunct) for conjunct in formula.conjuncts]
+            name = self.fresh_atom()
+            for atom, polarity in juncts:
+                self.clauses.append(frozenset([(name, False),
+                                               (atom, polarity)]))
+            self.clauses.append(frozenset([(name, True)] +
+                                          [(atom, not polarity)
+                                           for atom, polarity in juncts]))
+            return (name, True)
+        elif isinstance(formula, Or):
+            juncts = [self.encode(disjunct) for disjunct in formula.disjuncts]
+            name = self.fresh_atom()
+            for atom, polarity in juncts:
+                self.clauses.append(frozenset([(name, True),
+                                               (atom, not polarity)]))
+            self.clauses.append(frozenset([(name, False)] + juncts))
+            return (name, True)
+        elif isinstance(formula, If):
+            ant_atom, ant_polarity = self.encode(formula.antecedent)
+            cons_atom, cons_polarity = self.encode(formula.consequent)
+            name = self.fresh_atom()
+            self.clauses.append(frozenset([(name, False),
+                                           (ant_atom, not ant_polarity),
+                                           (cons_atom, cons_polarity)]))
+            self.clauses.append(frozenset([(name, True),
+                                           (ant_atom, ant_polarity)]))
+            self.clauses.append(frozenset([(name, True),
+                                           (cons_atom, not cons_polarity)]))
+            return (name, True)
+        else:
+            raise RuntimeError(f"{formula} has not been implemented")
+
+    def model(self, assignment: Assignment) -> Assignment:
+        """Restricts a satisfying assignment to the original atoms.
+
+        Atoms that the assignment leaves open are set to False.
+
+        :param assignment: A satisfying assignment of the clauses.
+
+        :returns: A dictionary whose keys are the atomic formulas of the
+            original formula and whose values are booleans.
+        """
+        return {atom: assignment.get(atom, False) for atom in self.atoms}
+
+
+##############
+# Propagator #
+##############
+
+
+class Propagator:
+    """The Propagator class holds a partial assignment of a ClauseForm.
+
+    Unit propagation uses two watched literals per clause, so assigning
+    an atom only visits the clauses watching the literal it falsifies.
+    Assignments are recorded on a trail and are undone by popping it;
+    the watches stay valid when the trail shrinks, so backtracking does
+    no work on the clauses.
+
+    :ivar clause_form: The ClauseForm being assigned.
+    :ivar values: The value of each atom, indexed by its number: 1 for
+        true, -1 for false and 0 for unassigned.
+    :ivar trail: The literals made true, in the order they were made true.
+    :ivar head: The position on the trail up to which literals have
+        been propagated.
+    :ivar consistent: False if the unit clauses alone are contradictory.
+    :ivar base: The length of the trail once the unit clauses have been
+        propagated.
+    """
+
+    def __init__(self, clause_form: ClauseForm):
+        """The init class for propagators.
+
+        This copies the clauses, watches the first two literals of
+        each one and propagates the unit clauses.
+        """
+        self.clause_form = clause_form
+        count = len(clause_form.variables)
+        self.values: List[int] = [0] * (count + 1)
+        self.trail: List[int] = []
+        self.head = 0
+        self.clauses = [list(clause) for clause in clause_form.literal_clauses]
+        self.watches: Dict[int, List[int]] = {}
+        for number in range(1, count + 1):
+            self.watches[number] = []
+            self.watches[-number] = []
+        self.consistent = True
+        for index, clause in enumerate(self.clauses):
+            if len(clause) == 1:
+                self.consistent = self.assign(clause[0]) and self.consistent
+            else:
+                self.watches[clause[0]].append(index)
+                self.watches[clause[1]].append(index)
+        self.consistent = self.consistent and self.propagate()
+        self.base = len(self.trail)
+
+    def value(self, literal: int) -> int:
+        """Returns 1 if a literal is true, -1 if it is false and 0 if its
+        atom is unassigned."""
+        value = self.values[abs(literal)]
+        return value if literal > 0 else -value
+
+    def assign(self, literal: int) -> bool:
+        """Makes a literal true without propagating it.
+
+        :param literal: The literal to make true.
+
+        :returns: False if the literal is already false, otherwise True.
+        """
+        value = self.value(literal)
+        if value != 0:
+            return value == 1
+        self.values[abs(literal)] = 1 if literal > 0 else -1
+        self.trail.append(literal)
+        return True
+
+    def propagate(self) -> bool:
+        """Propagates every literal on the trail that has not been
+        propagated yet.
+
+        :returns: False if a clause is falsified, otherwise True.
+        """
+        while self.head < len(self.trail):
+            false_literal = -self.trail[self.head]
+            self.head += 1
+            watching = self.watches[false_literal]
+            kept: List[int] = []
+            for position, index in enumerate(watching):
+                clause = self.clauses[index]
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], false_literal
+                other = clause[0]
+                if self.value(other) == 1:
+                    kept.append(index)
+                    continue
+                for candidate in range(2, len(clause)):
+                    if self.value(clause[candidate]) != -1:
+                        clause[1] = clause[candidate]
+                        clause[candidate] = false_literal
+                        self.watches[clause[1]].append(index)
+                        break
+                else:
+                    kept.append(index)
+                    if not self.assign(other):
+                        kept.extend(watching[position + 1:])
+                        self.watches[false_literal] = kept
+                        return False
+            self.watches[false_literal] = kept
+        return True
+
+    def undo(self, size: int) -> None:
+        """Unassigns the trail back to a given length.
+
+        :param size: The length of the trail to return to. The trail
+            must have been fully propagated at that length.
+        """
+        while len(self.trail) > size:
+            self.values[abs(self.trail.pop())] = 0
+        self.head = len(self.trail)
+
+    def extend(self, assignment: Assignment) -> bool:
+        """Adds an assignment to the trail and propagates it.
+
+        :param assignment: A dictionary of atomic formulas and booleans.
+
+        :returns: False if the assignment leads to a falsified clause,
+            otherwise True.
+        """
+        for literal in assignment.items():
+            if not self.assign(self.clause_form.literal(literal)):
+                return False
+        return self.propagate()
+
+    def assignment(self) -> Assignment:
+        """Returns the current assignment as a dictionary of atomic
+        formulas and booleans."""
+        return {self.clause_form.variables[abs(literal) - 1]: literal > 0
+                for literal in self.trail}
+
+    def search(self, assignment: Assignment) -> Optional[Assignment]:
+        """Searches for a satisfying extension of an assignment.
+
+        This is DPLL with an explicit stack of decisions. The trail is
+        first undone to the unit clauses, so a propagator can be reused
+        for many searches.
+
+        :param assignment: A dictionary of atomic formulas and booleans.
+
+        :returns: A satisfying assignment extending the input, or None
+            if there is none.
+        """
+        self.undo(self.base)
+        if not self.consistent or not self.extend(assignment):
+            return None
+        # Entries are (trail length before the decision, atom, flipped).
+        decisions: List[Tuple[int, int, bool]] = []
+        count = len(self.values) - 1
+        number = 1
+        while True:
+            while number <= count and self.values[number] != 0:
+                number += 1
+            if number > count:
+                return self.assignment()
+            decisions.append((len(self.trail), number, False))
+            self.assign(number)
+            while not self.propagate():
+                while decisions != [] and decisions[-1][2]:
+                    decisions.pop()
+                if decisions == []:
+                    return None
+                size, number, _ = decisions.pop()
+                self.undo(size)
+                decisions.append((size, number, True))
+                self.assign(-number)
+
+
+####################
+# Cube and Conquer #
+####################
+
+
+_worker_propagator: Optional[Propagator] = None
+
+
+def _init_worker(clause_form: ClauseForm) -> None:
+    """Gives each worker process its own propagator, so that only the
+    cubes are sent with each task."""
+    global _worker_propagator
+    _worker_propagator = Propagator(clause_form)
+
+
+def _conquer_cube(cube: Assignment) -> Optional[Assignment]:
+    """Runs DPLL on a single cube inside a worker process."""
+    assert _worker_propagator is not None
+    return _worker_propagator.search(cube)
+
+
+class CubeAndConquer:
+    """The CubeAndConquer class decides a formula using every core.
+
+    The cube phase splits the clause form of the formula into cubes
+    using a lookahead heuristic. The conquer phase hands the cubes to a
+    pool of worker processes and stops at the first satisfiable cube.
+
+    :ivar formula: This is the formula being decided.
+    :ivar clause_form: The ClauseForm of the formula.
+    :ivar processes: The number of worker processes.
+    :ivar max_cubes: The largest number of cubes the cube phase makes.
+    :ivar max_depth: The largest number of splits leading to a cube.
+    :ivar lookahead_atoms: The number of atoms tried at each split.
+    :ivar cubes: The cubes produced by the cube phase.
+    :ivar conquered: The number of cubes solved before the conquer
+        phase stopped.
+    :ivar assignment: A model of the formula, or None if the formula
+        has no model.
+    """
+
+    def __init__(self,
+                 formula: Formula,
+                 processes: Optional[int] = None,
+                 max_cubes: Optional[int] = None,
+                 max_depth: int = 10,
+                 lookahead_atoms: int = 8):
+        """The init class for cube and conquer.
+
+        This puts the formula into clause form, splits it into cubes
+        and solves the cubes.
+
+        :param processes: The number of worker processes. Defaults to
+            the number of cores.
+        :param max_cubes: The largest number of cubes to make. Defaults
+            to four per worker, so that a worker that finishes an easy
+            cube can take another one.
+        :param max_depth: The largest number of splits leading to a cube.
+        :param lookahead_atoms: The number of atoms tried at each split.
+            These are the unassigned atoms of the original formula that
+            occur in the most clauses.
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if processes < 1:
+            raise ValueError(f"processes must be at least 1, not {processes}")
+        if max_cubes is None:
+            max_cubes = 4 * processes
+        if max_cubes < 1:
+            raise ValueError(f"max_cubes must be at least 1, not {max_cubes}")
+        if max_depth < 0:
+            raise ValueError(f"max_depth must be at least 0, not {max_depth}")
+        if lookahead_atoms < 1:
+            raise ValueError("lookahead_atoms must be at least 1, "
+                             f"not {lookahead_atoms}")
+        self.formula = formula
+        self.clause_form = ClauseForm(formula)
+        self.processes = processes
+        self.max_cubes = max_cubes
+        self.max_depth = max_depth
+        self.lookahead_atoms = lookahead_atoms
+        self.propagator = Propagator(self.clause_form)
+        original = range(1, len(self.clause_form.atoms) + 1)
+        self.ranking = sorted(original,
+                              key=lambda number:
+                              -self.clause_form.occurrences[number])
+        self.cubes: List[Assignment] = []
+        self.conquered = 0
+        self.cube()
+        self.assignment = self.conquer()
+
+    def lookahead(self) -> Optional[Tuple[List[int], Optional[int]]]:
+        """Chooses the atom to split the propagator's current cube on.
+
+        Each candidate atom is assigned both ways and propagated. An
+        atom whose assignment fails forces the opposite value, which is
+        added to the cube. Otherwise the atom whose two branches force
+        the most assignments is chosen, measured by the product of the
+        number of atoms each branch assigns.
+
+        :returns: None if the cube has no model. Otherwise a tuple whose
+            first element is the list of forced literals and whose second
+            element is the atom to split on, or None if every atom of the
+            original formula is assigned.
+        """
+        propagator = self.propagator
+        forced: List[int] = []
+        while True:
+            best = None
+            best_score = -1
+            tried = 0
+            for number in self.ranking:
+                if tried >= self.lookahead_atoms:
+                    break
+                if propagator.values[number] != 0:
+                    continue
+                tried += 1
+                size = len(propagator.trail)
+                counts = []
+                for literal in [number, -number]:
+                    propagator.assign(literal)
+                    if propagator.propagate():
+                        counts.append(len(propagator.trail) - size)
+                    else:
+                        counts.append(0)
+                    propagator.undo(size)
+                if counts == [0, 0]:
+                    return None
+                elif 0 in counts:
+                    literal = number if counts[0] > 0 else -number
+                    propagator.assign(literal)
+                    if not propagator.propagate():
+                        return None
+                    forced.append(literal)
+                elif counts[0] * counts[1] > best_score:
+                    best = number
+                    best_score = counts[0] * counts[1]
+            # A forced literal can assign the best atom, in which case
+            # the remaining atoms are tried again.
+            if tried == 0:
+                return (forced, None)
+            if best is not None and propagator.values[best] == 0:
+                return (forced, best)
+
+    def cube(self) -> None:
+        """Splits the clause form into cubes and stores them in self.cubes.
+
+        The cube with the fewest assigned atoms is split first, so that
+        hard regions of the search space are divided more finely than
+        easy ones. Splitting stops at self.max_cubes cubes, and cubes
+        that are self.max_depth splits deep are not split further.
+        """
+        propagator = self.propagator
+        if not propagator.consistent:
+            return
+        # Entries are (assigned atoms, tiebreak, depth, literals, split atom).
+        heap: List[Tuple[int, int, int, List[int], int]] = []
+        done: List[List[int]] = []
+        pending: List[Tuple[int, List[int]]] = [(0, [])]
+        count = 0
+        while True:
+            for depth, literals in pending:
+                propagator.undo(propagator.base)
+                if not all(propagator.assign(literal)
+                           for literal in literals):
+                    continue
+                if not propagator.propagate():
+                    continue
+                result = self.lookahead()
+                if result is None:
+                    continue
+                forced, number = result
+                literals = literals + forced
+                if number is None or depth >= self.max_depth:
+                    done.append(literals)
+                else:
+                    heapq.heappush(heap, (len(propagator.trail), count,
+                                          depth, literals, number))
+                    count += 1
+            if heap == [] or len(heap) + len(done) >= self.max_cubes:
+                break
+            _, _, depth, literals, number = heapq.heappop(heap)
+            pending = [(depth + 1, literals + [number]),
+                       (depth + 1, literals + [-number])]
+        propagator.undo(propagator.base)
+        variables = self.clause_form.variables
+        self.cubes = [{variables[abs(literal) - 1]: literal > 0
+                       for literal in literals}
+                      for literals in done + [entry[3] for entry in heap]]
+
+    def conquer(self) -> Optional[Assignment]:
+        """Solves the cubes, stopping at the first satisfiable one.
+
+        With a single process the cubes are solved in order. Otherwise
+        they go on the task queue of a process pool, one cube per task,
+        so that idle workers keep taking cubes until none are left.
+
+        :returns: A satisfying assignment, or None if every cube
+            is unsatisfiable.
+        """
+        if self.cubes == []:
+            return None
+        if self.processes == 1 or len(self.cubes) == 1:
+            for cube in self.cubes:
+                self.conquered += 1
+                result = self.propagator.search(cube)
+                if result is not None:
+                    return result
+            return None
+        with multiprocessing.Pool(self.processes,
+                                  _init_worker,
+                                  (self.clause_form,)) as pool:
+            for result in pool.imap_unordered(_conquer_cube,
+                                              self.cubes,
+                                              chunksize=1):
+                self.conquered += 1
+                if result is not None:
+                    pool.terminate()
+                    return result
+        return None
+
+    def satisfiable(self) -> bool:
+        """Determines whether the formula has a model.
+
+        :returns: A boolean that indicates whether or not the formula
+            is satisfiable.
+        """
+        return self.assignment is not None
+
+    def contradiction(self) -> bool:
+        """Determines whether the formula has no model.
+
+        :returns: A boolean that indicates whether or not the formula
+            is a contradiction.
+        """
+        return self.assignment is None
+
+    def model(self) -> Optional[Dict[Atom, bool]]:
+        """Returns a model of the formula over its atomic formulas.
+
+        :returns: A dictionary of atomic formulas and booleans that
+            makes the formula true, or None if there is none.
+        """
+        if self.assignment is None:
+            return None
+        return self.clause_form.model(self.assignment)
@@ -77,3 +77,100 @@ class TestBenchmark(unittest.TestCase):
         tt = TruthTable(f)
 
 
+
+class TestCubeAndConquer(unittest.TestCase):
+
+    def test_satisfiable(self):
+        formula = And([Or([P, Q]), Not(P), If(Q, R)])
+        solver = CubeAndConquer(formula, processes=1)
+        self.assertEqual(solver.satisfiable(), True)
+        model = solver.model()
+        self.assertEqual(model[P], False)
+        self.assertEqual(model[Q], True)
+        self.assertEqual(model[R], True)
+
+    def test_contradiction(self):
+        formula = Not(If(And([P,
+                              If(P, Q),
+                              If(Q, R),
+                              If(R, S)]), S))
+        solver = CubeAndConquer(formula, processes=1)
+        self.assertEqual(solver.contradiction(), True)
+        self.assertEqual(solver.model(), None)
+
+    def test_agrees_with_truth_table(self):
+        rf = RandomFormulaGenerator()
+        rf.atoms = set(map(lambda x: Atom(str(x)), range(6)))
+        for _ in range(20):
+            f = rf.random_formula_of_depth(Atom("p"), 4)
+            solver = CubeAndConquer(f, processes=1, max_cubes=4)
+            table = TruthTable(f)
+            self.assertEqual(solver.contradiction(), table.contradiction())
+            if solver.satisfiable():
+                model = solver.model()
+                self.assertEqual(table.resolve_internal(f, model), True)
+
+    def pigeonhole(self, pigeons, holes):
+        atoms = {(i, j): Atom(f"p{i}_{j}")
+                 for i in range(pigeons) for j in range(holes)}
+        clauses = [Or([atoms[i, j] for j in range(holes)])
+                   for i in range(pigeons)]
+        for j in range(holes):
+            for i in range(pigeons):
+                for k in range(i + 1, pigeons):
+                    clauses.append(Not(And([atoms[i, j], atoms[k, j]])))
+        return And(clauses)
+
+    def test_parallel(self):
+        for processes in [1, 2]:
+            solver = CubeAndConquer(self.pigeonhole(5, 5),
+                                    processes=processes,
+                                    max_cubes=8)
+            self.assertEqual(solver.satisfiable(), True)
+            self.assertEqual(1 <= len(solver.cubes) <= 8, True)
+            solver = CubeAndConquer(self.pigeonhole(6, 5),
+                                    processes=processes,
+                                    max_cubes=8)
+            self.assertEqual(solver.contradiction(), True)
+
+    def test_parallel_agrees_with_serial(self):
+        formula = self.pigeonhole(6, 5)
+        serial = CubeAndConquer(formula, processes=1, max_cubes=6)
+        parallel = CubeAndConquer(formula, processes=2, max_cubes=6)
+        self.assertEqual(parallel.cubes, serial.cubes)
+        self.assertEqual(parallel.contradiction(), serial.contradiction())
+
+    def test_uneven_cubes(self):
+        solver = CubeAndConquer(self.pigeonhole(6, 5),
+                                processes=1,
+                                max_cubes=6)
+        sizes = [len(cube) for cube in solver.cubes]
+        self.assertEqual(min(sizes) < max(sizes), True)
+
+    def test_stops_at_first_satisfiable_cube(self):
+        atoms = [Atom(str(x)) for x in range(40)]
+        formula = And([Or([atoms[i], atoms[i + 1]]) for i in range(39)])
+        for processes in [1, 2]:
+            solver = CubeAndConquer(formula,
+                                    processes=processes,
+                                    max_cubes=8)
+            self.assertEqual(solver.satisfiable(), True)
+            self.assertEqual(len(solver.cubes) > 1, True)
+            self.assertEqual(solver.conquered, 1)
+
+    def test_many_atoms(self):
+        pairs = [(Atom(f"a{i}"), Atom(f"b{i}")) for i in range(1500)]
+        formula = And([Or([a, b]) for a, b in pairs])
+        solver = CubeAndConquer(formula, processes=1, max_cubes=1)
+        model = solver.model()
+        self.assertEqual(all(model[a] or model[b] for a, b in pairs), True)
+
+    def test_processes_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            CubeAndConquer(P, processes=0)
+        with self.assertRaises(ValueError):
+            CubeAndConquer(P, processes=1, max_cubes=0)
+        with self.assertRaises(ValueError):
+            CubeAndConquer(P, processes=1, max_depth=-1)
+        with self.assertRaises(ValueError):
+            CubeAndConquer(P, processes=1, lookahead_atoms=0)